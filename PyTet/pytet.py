@@ -14,6 +14,9 @@ except ImportError as e:
     sys.exit(1)
 
 class Piece:
+    __slots__ = ('prototype', 'rotCellMaps', 'rotCellCoords', 'rotRowBits', 
+                 'rotBounds', 'bboxsize')
+
     CELLMAPS = {
         'I': [
             (
@@ -138,7 +141,7 @@ class Piece:
         ]
     }
 
-    PROTOTYPES = sorted(CELLMAPS.keys())
+    PROTOTYPES = tuple(sorted(CELLMAPS))
 
     PIECE_VALUES = {
         'I': 4,
@@ -152,45 +155,121 @@ class Piece:
 
     def __init__(self, prototype):
         self.prototype = prototype
-        self.rotCellMaps = self.CELLMAPS[prototype]
+        # 4 cellmaps, one per rotation angle, with no integer references:
+        self.rotCellMaps = self._MAPS[prototype]
+        # Same for the cell coords, row bits and bounds, to skip the dict 
+        # lookups:
+        self.rotCellCoords = self._COORDS[prototype]
+        self.rotRowBits = self._ROW_BITS[prototype]
+        self.rotBounds = self._BOUNDS[prototype]
         self.bboxsize = len(self.rotCellMaps[0][0]) # assuming they are square
 
     def __repr__(self):
         return '%s(%r)' % (type(self).__name__, self.prototype)
 
+    @classmethod
+    def _buildCellTables(cls):
+        """Resolve the integer references in CELLMAPS and precompute the cell
+        coordinates for every prototype and rotation, once per class, so we
+        don't have to parse the strings every time we need them.
+        Also precompute the row bitmasks of the cells (bit N == column N)
+        and the (min_x, max_x, max_y) bounds of the cells.
+        """
+        cls._MAPS = {}
+        cls._COORDS = {}
+        cls._ROW_BITS = {}
+        cls._BOUNDS = {}
+
+        for prototype, rotCellMaps in cls.CELLMAPS.items():
+            maps = []
+
+            for rot in range(4):
+                cellmap = rotCellMaps[rot]
+
+                # Integer cellmap is just a reference to another angle:
+                while isinstance(cellmap, int):
+                    cellmap = rotCellMaps[cellmap]
+
+                maps.append(cellmap)
+
+            cls._MAPS[prototype] = tuple(maps)
+            cls._COORDS[prototype] = tuple(
+                tuple((x, y) for y, s in enumerate(cellmap)
+                             for x, ch in enumerate(s) if ch != ' ')
+                for cellmap in maps
+            )
+
+            rowBits = []
+
+            for cellmap in maps:
+                rows = []
+
+                for y, s in enumerate(cellmap):
+                    xs = [x for x, ch in enumerate(s) if ch != ' ']
+                    if xs:
+                        rows.append((y, 
+                                     sum(1 << x for x in xs), 
+                                     min(xs), 
+                                     max(xs)))
+
+                rowBits.append(tuple(rows))
+
+            cls._ROW_BITS[prototype] = tuple(rowBits)
+
+            cls._BOUNDS[prototype] = tuple(
+                (min(x for x, y in coords), 
+                 max(x for x, y in coords), 
+                 max(y for x, y in coords))
+                for coords in cls._COORDS[prototype]
+            )
+
     def getCellMap(self, rot=0):
         """Get the cell map for the piece, given its rotation angle (multiple
         of 90-degree)
         """
-        result = self.rotCellMaps[rot % 4]
-
-        if not isinstance(result, int):
-            return result
-         
-        # Integer cellmap is just a reference to another angle:
-        return self.getCellMap(result)
+        return self.rotCellMaps[rot & 3]
     
     def getCellCoords(self, dx=0, dy=0, rot=0):
         """Return a list of integer (x, y) pairs: coordinates of the piece
         cells, corresponding to the specified rotation (0..3 == 0..270 degrees). 
         Add dx and dy to all of them.
         """
-        cellmap = self.getCellMap(rot)
-        result = []
+        return [(x + dx, y + dy) 
+                for x, y in self.rotCellCoords[rot & 3]]
 
-        for y, s in enumerate(cellmap):
-            if s.strip():
-                for x, ch in enumerate(s):
-                    if ch.strip():
-                        result.append((x + dx, y + dy))
+    def getBounds(self, rot=0):
+        """Return (min_x, max_x, max_y) of the piece cells, corresponding to 
+        the specified rotation
+        """
+        return self.rotBounds[rot & 3]
 
-        return result
+    def getRowBits(self, rot=0):
+        """Return a tuple of (y, bits, min_x, max_x) for every non-empty row
+        of the piece cells, corresponding to the specified rotation. Bit N 
+        of the bits is set if there is a cell in the column N.
+        """
+        return self.rotRowBits[rot & 3]
+
+    @classmethod
+    def _buildTemplates(cls):
+        """Make one instance per prototype. The pieces never change after 
+        they are made (the position of the current piece is kept by the well),
+        so it's safe to share them.
+        """
+        cls._TEMPLATES = tuple(cls(prototype) for prototype in cls.PROTOTYPES)
+        cls._bag = []
 
     @classmethod
     def makeRandom(cls):
-        """Make an instance of the class with a random prototype
+        """Return an instance of the class with a random prototype. 
+        The pieces are drawn from a "bag" with one of each prototype in it, 
+        shuffled, and refilled when it gets empty - so there are never 
+        long droughts, or floods, of the same piece.
         """
-        return cls(random.choice(cls.PROTOTYPES))
+        if not cls._bag:
+            cls._bag = random.sample(cls._TEMPLATES, len(cls._TEMPLATES))
+
+        return cls._bag.pop()
 
     @property
     def value(self):
@@ -211,6 +290,33 @@ class Piece:
         return tuple(int(x * 255) for x in fresult)
 
 
+Piece._buildCellTables()
+Piece._buildTemplates()
+
+
+class PieceState:
+    """The piece falling in the well, with its color and current transform.
+    The row bits and bounds of the piece at its current rotation are kept 
+    here too, so falling and moving sideways don't have to look them up.
+    """
+    __slots__ = ('piece', 'color', 'x', 'y', 'rot', 'rowBits', 'bounds')
+
+    def __init__(self, piece, color, x, y, rot=0):
+        self.piece = piece
+        self.color = color
+        self.x = x
+        self.y = y
+        self.setRot(rot)
+
+    def setRot(self, rot):
+        """Set the rotation angle (multiple of 90-degree), along with the row
+        bits and bounds at it
+        """
+        self.rot = rot & 3
+        self.rowBits = self.piece.getRowBits(rot)
+        self.bounds = self.piece.getBounds(rot)
+
+
 class Well:
     """The well in which the pieces are falling
     """
@@ -224,119 +330,166 @@ class Well:
     HIT_SHARDS = 4
     GAME_OVER = 10
 
+    # The number of the random colors to choose from for the pieces:
+    PALETTE_SIZE = 64
+
+    # Sideways shifts to try, in this order, when the rotated piece hits
+    # a side of the well:
+    KICKS = {
+        HIT_LEFT_SIDE: (1, 2),
+        HIT_RIGHT_SIDE: (-1, -2),
+    }
+
+    # Bits of a fully populated row:
+    FULL_ROW = (1 << CELLS_X) - 1
+
+    # The pieces are dropped from above the well and can be sharded there,
+    # so we have to keep a few invisible rows above the top one:
+    ROWS_ABOVE = 4
+
     def __init__(self):
         self.reset()
 
     def reset(self):
         """Full reset of the well
         """
-        self.shards = {}
+        # One int per row, bit N is set if there is a shard in column N.
+        # Row y is stored at index y + ROWS_ABOVE:
+        self.rowMasks = [0] * (self.ROWS_ABOVE + self.CELLS_Y)
+        # Index of the topmost row of rowMasks which may have shards. It may 
+        # be less than the actual one, but never more:
+        self.topRow = len(self.rowMasks)
+        # The colors of the shards (None for the empty cells), row by row,
+        # cell (x, y) is stored at index (y + ROWS_ABOVE) * CELLS_X + x:
+        self.cells = [None] * ((self.ROWS_ABOVE + self.CELLS_Y) * self.CELLS_X)
+        # Cached shard cells for drawing, None when it needs a rebuild:
+        self._shardsDrawCache = None
+        # Cached piece cells for drawing, and the (piece state, x, y, rot)
+        # they are for:
+        self._pieceDrawCache = []
+        self._pieceDrawKey = None
         self.score = 0
         self.nrows = 0
         self.level = 1
-        self.curPieceData = {}
+        self.curPiece = None
         self.nextPieceAndColor = self.makeNextPieceAndColor()
 
+    @classmethod
+    def _buildPalette(cls):
+        """Make the random colors for the pieces once, so we don't have to 
+        convert them from HSV for every new piece. This also keeps the number
+        of the pre-rendered cells bounded.
+        """
+        cls._PALETTE = tuple(Piece.makeRandomColor(s=(0.75, 1), v=(0.8, 0.9))
+                             for i in range(cls.PALETTE_SIZE))
+
     @classmethod
     def makeNextPieceAndColor(cls):
         """Prepare and return a 2-element tuple: the next piece and its color,
         randomly generated.
         """
         piece = Piece.makeRandom()
-        color = Piece.makeRandomColor(s=(0.75, 1), v=(0.8, 0.9))
+        color = random.choice(cls._PALETTE)
         return piece, color
 
     def dropNextPiece(self):
         piece, color = self.nextPieceAndColor
 
-        self.curPieceData = {
-            'piece': piece,
-            'color': color,
-            'x': self.CELLS_X // 2 - piece.bboxsize // 2,
-            'y': -piece.bboxsize + 1,
-            'rot': 0
-        }
+        self.curPiece = PieceState(piece, color,
+                                   x=self.CELLS_X // 2 - piece.bboxsize // 2,
+                                   y=-piece.bboxsize + 1)
         self.nextPieceAndColor = self.makeNextPieceAndColor()
 
     def checkCollision(self, dx, dy, drot):
         """Check the hypotetical/future position of the piece and 
         return one of HIT_* values.
-        Abs values of dx, dy and drot cannot be more than 1!
+        Abs values of dy and drot must not be more than 1 (not checked)!
         """
-        if not self.curPieceData:
+        if self.curPiece is None:
             return False
 
-        #assert(abs(dx) <= 1)   # we might need more for bouncing off the sides!
-        assert(abs(dy) <= 1)
-        assert(abs(drot) <= 1)
-
-        piece = self.curPieceData['piece']
-        x = self.curPieceData['x'] + dx
-        y = self.curPieceData['y'] + dy
-        rot = self.curPieceData['rot'] + drot
+        cur = self.curPiece
+        x = cur.x + dx
+        y = cur.y + dy
 
         # Hypothetical new transform:
-        cellCoords = piece.getCellCoords(x, y, rot)
-        
-        # Check against wells boundaries:
-        for x, y in cellCoords:
-            if x < 0:
-                return self.HIT_LEFT_SIDE
+        if drot:
+            rot = cur.rot + drot
+            rowBits = cur.piece.getRowBits(rot)
+            minx, maxx, maxy = cur.piece.getBounds(rot)
+        else:
+            rowBits = cur.rowBits
+            minx, maxx, maxy = cur.bounds
+
+        # Check against wells boundaries. The bounds of the whole piece tell
+        # us if we are within them; if we are not, we go row by row, left to
+        # right, to find out which boundary was hit first:
+        W = self.CELLS_X
+        H = self.CELLS_Y
 
-            if x >= self.CELLS_X:
-                return self.HIT_RIGHT_SIDE
+        if x + minx < 0 or x + maxx >= W or y + maxy >= H:
+            for cy, bits, rowMinX, rowMaxX in rowBits:
+                if x + rowMinX < 0:
+                    return self.HIT_LEFT_SIDE
 
-            if y >= self.CELLS_Y:
-                return self.HIT_BOTTOM
+                if x + rowMinX >= W:
+                    return self.HIT_RIGHT_SIDE
+
+                if y + cy >= H:
+                    return self.HIT_BOTTOM
+
+                if x + rowMaxX >= W:
+                    return self.HIT_RIGHT_SIDE
             
-        # Check against the existing shards:
-        return self.HIT_SHARDS if any(k in self.shards for k in cellCoords) \
-               else self.HIT_NONE
+        # Check against the existing shards. 
+        # NOTE: with at most 4 piece cells against the 10-bit rows, there is 
+        # nothing to gain from any fancier spatial structure like hashing or
+        # trees. The only cheap win is skipping the test altogether while the
+        # whole piece is above the shards, which is the case most of the time:
+        y += self.ROWS_ABOVE
+
+        if y + maxy < self.topRow:
+            return self.HIT_NONE
+
+        # We know we are within the well's sides here, so shifting by 
+        # negative x can't lose any bits:
+        rowMasks = self.rowMasks
+
+        for cy, bits, rowMinX, rowMaxX in rowBits:
+            if rowMasks[y + cy] & (bits << x if x >= 0 else bits >> -x):
+                return self.HIT_SHARDS
+
+        return self.HIT_NONE
 
     def shardPiece(self):
         """Turn the current piece into shards
         """
-        if not self.curPieceData:
+        cur = self.curPiece
+
+        if cur is None:
             return 0
         
-        piece = self.curPieceData['piece']
-        x = self.curPieceData['x']
-        y = self.curPieceData['y']
-        rot = self.curPieceData['rot']
-        color = self.curPieceData['color']
-
-        for x, y in piece.getCellCoords(x, y, rot):
-            if x >= 0 and x < self.CELLS_X and \
-               y < self.CELLS_Y:
-                self.shards[(x, y)] = color
+        color = cur.color
+        W = self.CELLS_X
+        H = self.CELLS_Y
+        rowMasks = self.rowMasks
+        cells = self.cells
+        topRow = self.topRow
 
-        self.curPieceData = {}
+        for x, y in cur.piece.getCellCoords(cur.x, cur.y + self.ROWS_ABOVE, 
+                                            cur.rot):
+            # y is the index of the row here, including the hidden ones:
+            if x >= 0 and x < W and y < H + self.ROWS_ABOVE:
+                rowMasks[y] |= 1 << x
+                topRow = min(topRow, y)
+                cells[y * W + x] = color
 
-        return piece.value
-
-    def removeShardLayer(self, row):
-        """Remove the row of shards, but that's it. Don't attempt to drop the
-        cells above.
-        """
-        for x, y in list(self.shards.keys()):
-            if y == row:
-                self.shards.pop((x, y))
-
-    def dropCellsAboveCollapsedRow(self, row):
-        """Drop sharded cells above the specified row, into empty spaces below.
-        """
-        while True:
-            anyChanges = False
+        self.topRow = topRow
 
-            for eachrow in range(row-1, -1, -1):
-                rowXYs = [(x, y) for (x, y) in self.shards.keys() if y == eachrow]
-                for x, y in rowXYs:
-                    if (x, y+1) not in self.shards:
-                        self.shards[(x, y+1)] = self.shards.pop((x, y))
-                        anyChanges = True
+        self.curPiece = None
+        self._shardsDrawCache = None
 
-            if not anyChanges:
-                return
+        return cur.piece.value
 
     def checkAndCollapseShards(self):
         """Check rows, collapse the fully populated ones, slide shards above.
@@ -344,45 +497,84 @@ class Well:
         """
         result = 0
 
-        y = self.CELLS_Y - 1
+        # Most of the time there is nothing to collapse, and the C-level scan
+        # of the list tells us so without a Python loop:
+        if self.FULL_ROW not in self.rowMasks:
+            return result
 
-        while y >=0:
-            if all((x, y) in self.shards for x in range(0, self.CELLS_X)):
-                self.removeShardLayer(y)
-                self.dropCellsAboveCollapsedRow(y)
-                result += 1
-            else:
-                y -= 1
+        # The rows to keep: all the hidden ones, and the ones which are not
+        # full within the well:
+        keep = list(range(self.ROWS_ABOVE))
+        keep.extend(i for i in range(self.ROWS_ABOVE, len(self.rowMasks))
+                    if self.rowMasks[i] != self.FULL_ROW)
+
+        result = len(self.rowMasks) - len(keep)
+
+        # Compact the kept rows to the bottom in a single pass, whatever the
+        # number of the destroyed rows is, and add as many empty ones on top:
+        W = self.CELLS_X
+        cells = [None] * (result * W)
+
+        for i in keep:
+            cells.extend(self.cells[i * W:(i + 1) * W])
+
+        self.rowMasks = [0] * result + [self.rowMasks[i] for i in keep]
+        self.cells = cells
+        self.topRow += result
+        self._shardsDrawCache = None
         
         return result
 
+    def makePieceCellsForDrawing(self):
+        """Return a list of the current piece cells to be drawn, in the same
+        format as makeCellsForDrawing(). The list is cached until the piece
+        moves, so don't modify it!
+        """
+        cur = self.curPiece
+        key = None if cur is None else (cur, cur.x, cur.y, cur.rot)
+
+        if key != self._pieceDrawKey:
+            self._pieceDrawKey = key
+            self._pieceDrawCache = result = []
+
+            if cur is not None:
+                color = cur.color
+                W = self.CELLS_X
+                H = self.CELLS_Y
+
+                for (x, y) in cur.piece.getCellCoords(cur.x, cur.y, cur.rot):
+                    if x >= 0 and x < W and y >= 0 and y < H:
+                        result.append((x, y, color, True))
+
+        return self._pieceDrawCache
+
     def makeCellsForDrawing(self):
         """Return a full list of cells to be drawn. Each element is a tuple:
         (x, y, (R, G, B), is_piece)
         """
-        result = []
+        # Current piece:
+        result = list(self.makePieceCellsForDrawing())
 
-        if self.curPieceData:
-            piece = self.curPieceData['piece']
-            x = self.curPieceData['x']
-            y = self.curPieceData['y']
-            rot = self.curPieceData['rot']
-            color = self.curPieceData['color']
+        # Shards only change when a piece is sharded or rows collapse, so we
+        # keep them cached in between:
+        if self._shardsDrawCache is None:
+            self._shardsDrawCache = shards = []
+            W = self.CELLS_X
+            rowMasks = self.rowMasks
+            cells = self.cells
 
-            # Current piece:
-            for (x, y) in piece.getCellCoords(x, y, rot):
-                if x >= 0 and x < self.CELLS_X and \
-                   y >= 0 and y < self.CELLS_Y:
-                    result.append((x, y, color, True))
-
-        # Shards:
-        for (x, y), color in sorted(self.shards.items()):
             # Never draw stuff outside the well: 
-            if x < 0 or x >= self.CELLS_X or \
-               y < 0 or y >= self.CELLS_Y:
-                continue
+            for y in range(self.CELLS_Y):
+                i = y + self.ROWS_ABOVE
+
+                if not rowMasks[i]:
+                    continue
 
-            result.append((x, y, color, False))
+                for x, color in enumerate(cells[i * W:(i + 1) * W]):
+                    if color is not None:
+                        shards.append((x, y, color, False))
+
+        result.extend(self._shardsDrawCache)
 
         return result
 
@@ -392,7 +584,7 @@ class Well:
         collapse the shards etc.
         Return the hit event
         """
-        if not self.curPieceData:
+        if self.curPiece is None:
             self.dropNextPiece()
 
             if self.checkCollision(dx=0, dy=0, drot=0) != self.HIT_NONE:
@@ -408,9 +600,13 @@ class Well:
             return hit
 
         if hit == self.HIT_NONE:
-            self.curPieceData['x'] += dx
-            self.curPieceData['y'] += dy
-            self.curPieceData['rot'] += drot
+            cur = self.curPiece
+            cur.x += dx
+            cur.y += dy
+
+            if drot:
+                cur.setRot(cur.rot + drot)
+
             return hit
         
         if hit in (self.HIT_BOTTOM, self.HIT_SHARDS):
@@ -432,6 +628,41 @@ class Well:
         raise RuntimeError('checkCollision returned unsupported value: ' \
                            '%s' % repr(hit))
 
+    def tryKick(self, drot):
+        """Rotate the falling piece by drot. If it hits a side of the well 
+        after that, shift it away from that side, trying the KICKS in turn 
+        while it keeps hitting the same side. Only the first transform which
+        fits, if any, is applied to the piece. 
+        Return the hit of the rotation without any shifting.
+        """
+        hit = self.checkCollision(0, 0, drot)
+
+        dx = 0
+
+        if hit in self.KICKS:
+            for dx in self.KICKS[hit]:
+                kickHit = self.checkCollision(dx, 0, drot)
+
+                if kickHit != hit:
+                    break
+
+            if kickHit != self.HIT_NONE:
+                return hit
+
+        elif hit != self.HIT_NONE or self.curPiece is None:
+            return hit
+
+        cur = self.curPiece
+        cur.x += dx
+
+        if drot:
+            cur.setRot(cur.rot + drot)
+
+        return hit
+
+
+Well._buildPalette()
+
   
 class GraphicDevice:
     SCREEN_MIN_X = 0
@@ -440,13 +671,54 @@ class GraphicDevice:
     SCREEN_MAX_Y = 720
     CELL_SIZE = 24
 
+    # Every piece gets a random color, so don't keep the pre-rendered cells
+    # of all the colors ever used:
+    CELL_SURF_CACHE_SIZE = 256
+
+    # pygame-ce can blit a sequence without building the list of the 
+    # resulting rects at all:
+    HAVE_FBLITS = hasattr(pygame.Surface, 'fblits')
+
+    LEFT_PANEL_LABELS = ('Score:', 'Rows:', 'Level:')
+
+    # What the keys do to the piece and the game: (dx, drot, dlevel)
+    KEY_DELTAS = {
+        pygame.K_LEFT:      (-1, 0, 0),
+        pygame.K_a:         (-1, 0, 0),
+        pygame.K_RIGHT:     (1, 0, 0),
+        pygame.K_d:         (1, 0, 0),
+        pygame.K_UP:        (0, -1, 0),
+        pygame.K_w:         (0, -1, 0),
+        pygame.K_DOWN:      (0, 1, 0),
+        pygame.K_s:         (0, 1, 0),
+        pygame.K_KP_PLUS:   (0, 0, 1),
+        pygame.K_KP_MINUS:  (0, 0, -1),
+    }
+
+    # The window contents may have been lost after these (e.g. when the
+    # window gets restored or uncovered), so the whole page is redrawn:
+    REDRAW_EVENTS = tuple(getattr(pygame, x) for x in
+                          ('VIDEOEXPOSE', 'WINDOWEXPOSED', 'WINDOWSHOWN',
+                           'WINDOWRESTORED')
+                          if hasattr(pygame, x))
+
     def __init__(self, well):
         self.well = well
         pygame.init()
         pygame.key.set_repeat(200, 30)
 
+        # These are the only events we ever look at, don't let SDL queue up
+        # the rest (mouse motion etc.) for us to skip every frame:
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, 
+                                  pygame.TEXTINPUT] + list(self.REDRAW_EVENTS))
+
+        # Let SDL use the hardware surfaces, if it can. No DOUBLEBUF:
+        # drawPage() redraws and updates just the parts that have changed,
+        # which only works on a single buffer:
         self.pgscreen = pygame.display.set_mode([self.SCREEN_MAX_X, 
-                                                  self.SCREEN_MAX_Y])
+                                                  self.SCREEN_MAX_Y],
+                                                 pygame.HWSURFACE)
         wellOrgX = (self.SCREEN_MAX_X + self.SCREEN_MIN_X) // 2 - \
                     Well.CELLS_X // 2 * self.CELL_SIZE
         wellOrgY = (self.SCREEN_MAX_Y + self.SCREEN_MIN_Y) // 2 - \
@@ -458,6 +730,17 @@ class GraphicDevice:
              wellOrgY + Well.CELLS_Y * self.CELL_SIZE)
          )
 
+        # The device rects of all the well cells, [y][x], so we don't have 
+        # to map the coordinates for every cell we draw:
+        self._wellCellRects = [
+            [pygame.Rect(wellOrgX + x * self.CELL_SIZE + 1,
+                         wellOrgY + y * self.CELL_SIZE + 1,
+                         self.CELL_SIZE - 1, 
+                         self.CELL_SIZE - 1)
+             for x in range(Well.CELLS_X)]
+            for y in range(Well.CELLS_Y)
+        ]
+
         sidePanelWidth = ((self.SCREEN_MAX_X - self.SCREEN_MIN_X) - \
                           (self.wellBbox[1][0] - self.wellBbox[0][0])) // 4
         sidePanelHeight = (self.SCREEN_MAX_Y - self.SCREEN_MIN_Y) // 3
@@ -487,8 +770,39 @@ class GraphicDevice:
         self.smallFont = pygame.font.SysFont(None, 22)
         self.largeFont = pygame.font.Font(pygame.font.get_default_font(), 32)
 
+        # Pre-rendered cells, keyed by their colors, oldest first:
+        self._cellSurfCache = {}
+
+        # Pre-rendered well backgrounds, keyed by their colors:
+        self._wellBGs = {}
+
+        # Pre-rendered left panel backgrounds with the labels, keyed by their
+        # colors, and the values rendered last time:
+        self._leftPanelBGs = {}
+        self._leftPanelValues = None
+        self._leftPanelValueSurfs = ()
+
+        # Pre-rendered right panel and the (bgcolor, next piece and color) it
+        # was rendered for:
+        self._rightPanel = None
+        self._rightPanelKey = None
+
+        # The falling piece and the level drawn by the last drawPage(), 
+        # the piece transform, and the rects of the piece cells:
+        self._drawnState = None
+        self._drawnPieceXYRot = None
+        self._pieceRects = []
+
+    @classmethod
+    def makeSurface(cls, size):
+        """Make a new off-screen surface, in the same pixel format as the 
+        display, so blitting it doesn't need any conversion
+        """
+        return pygame.Surface(size).convert()
+
     def initPage(self):
         self.pgscreen.fill((127, 127, 127))
+        self._drawnState = None
 
     @classmethod
     def flipPage(cls):
@@ -500,8 +814,14 @@ class GraphicDevice:
         if not font:
             font = self.smallFont
         textobj = font.render(text, True, color)
+        self.blitText(x, y, textobj)
+
+    def blitText(self, x, y, textobj, surf=None):
+        """Blit the already rendered text at the given coordinates 
+        (left, bottom)
+        """
         textrect = textobj.get_rect(left=x, bottom=y)
-        self.pgscreen.blit(textobj, textrect)
+        (surf or self.pgscreen).blit(textobj, textrect)
 
     def askUser(self, msg):
         """Draw a text message, wait for the user's Y/N input
@@ -515,6 +835,10 @@ class GraphicDevice:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     return False
+
+                if event.type in self.REDRAW_EVENTS:
+                    # The page with the message is still there, show it again:
+                    pygame.display.flip()
                 
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_y:
@@ -540,17 +864,14 @@ class GraphicDevice:
 
         return (x * self.CELL_SIZE + dx, y * self.CELL_SIZE + dy)
 
-    def _drawDeviceCell(self, x, y, color, bg=False):
-        """Draw the cell box, using the device's x y coordinates of the top 
-        left corner of the cell, and self.CELL_SIZE as its width and height.
+    def _makeCellSurface(self, color):
+        """Render the cell box into a new surface, which is 1 pixel smaller
+        than self.CELL_SIZE, to leave a gap between the cells.
         TODO: make it look nicer!
         """
-        rect = (x + 1, y + 1, self.CELL_SIZE - 1, self.CELL_SIZE - 1)
-        pygame.draw.rect(self.pgscreen, color, rect)
+        surf = self.makeSurface((self.CELL_SIZE - 1, self.CELL_SIZE - 1))
+        surf.fill(color)
 
-        if bg:
-            return
-        
         # Add the cheap "3D" effect - inspired by the Soviet concrete fence ;)
         def lerp(a, b, mix):
             """Basic linear interpolation between 2 int/float values
@@ -564,6 +885,9 @@ class GraphicDevice:
 
         GAP = 2
 
+        # The top left corner of the cell, in the surface coordinates:
+        x = y = -1
+
         # 6 points to make the 4 polygons of the 3D pattern:
         lt = (x + GAP,                      y + GAP)
         lb = (x + GAP,                      y + self.CELL_SIZE - GAP)
@@ -581,15 +905,50 @@ class GraphicDevice:
         rc = clerp(color, black, 0.24)
         lc = clerp(color, white, 0.24)
 
-        pygame.draw.polygon(self.pgscreen, tc, (lt, rt, rm, lm))
-        pygame.draw.polygon(self.pgscreen, bc, (lb, rb, rm, lm))
-        pygame.draw.polygon(self.pgscreen, lc, (lt, lm, lb))
-        pygame.draw.polygon(self.pgscreen, rc, (rt, rb, rm))
+        pygame.draw.polygon(surf, tc, (lt, rt, rm, lm))
+        pygame.draw.polygon(surf, bc, (lb, rb, rm, lm))
+        pygame.draw.polygon(surf, lc, (lt, lm, lb))
+        pygame.draw.polygon(surf, rc, (rt, rb, rm))
+
+        return surf
+
+    def getCellSurface(self, color):
+        """Get the pre-rendered cell of the given color. Once the cache is 
+        full, the oldest cell gets dropped to make room for the new one.
+        """
+        surf = self._cellSurfCache.get(color)
+
+        if surf is None:
+            if len(self._cellSurfCache) >= self.CELL_SURF_CACHE_SIZE:
+                del self._cellSurfCache[next(iter(self._cellSurfCache))]
+
+            surf = self._cellSurfCache[color] = self._makeCellSurface(color)
+
+        return surf
+
+    def _drawDeviceCell(self, x, y, color, bg=False):
+        """Draw the cell box, using the device's x y coordinates of the top 
+        left corner of the cell, and self.CELL_SIZE as its width and height.
+        """
+        rect = (x + 1, y + 1, self.CELL_SIZE - 1, self.CELL_SIZE - 1)
+        self._drawDeviceCellRect(rect, color, bg)
+
+    def _drawDeviceCellRect(self, rect, color, bg=False):
+        """Draw the cell box into the given device rect. The BG cells are 
+        just plain boxes, the others are blitted from the pre-rendered 
+        surfaces, one per color.
+        """
+        if bg:
+            self.pgscreen.fill(color, rect)
+            return
+
+        self.pgscreen.blit(self.getCellSurface(color), rect)
         
     def drawWellCell(self, x, y, color, bg=False):
         """Draw the cell in the well, using its well coordinates 
+        (must be within the well)
         """
-        self._drawDeviceCell(*self.mapWellCoordsToDevice(x, y), color, bg)
+        self._drawDeviceCellRect(self._wellCellRects[y][x], color, bg)
 
     def drawNextPanelCell(self, x, y, color):
         """Draw the cell in the "next" panel using its piece coordinates 
@@ -603,59 +962,184 @@ class GraphicDevice:
         height = bbox[1][1] - miny
         return pygame.Rect(minx, miny, width, height)
 
-    def drawWellBG(self, color):
-        """Draw the BG of the well
+    def _makeWellBG(self, color):
+        """Render the BG of the well: the empty cells over the darker 
+        gaps between them, into a new surface
         """
-        pygame.draw.rect(self.pgscreen, 
-                          [x // 2 for x in color], 
-                          self.makePyRect(self.wellBbox))
+        surf = self.makeSurface(self.makePyRect(self.wellBbox).size)
+        surf.fill([x // 2 for x in color])
+
         for x in range(self.well.CELLS_X):
             for y in range(self.well.CELLS_Y):
-                self.drawWellCell(x, y, color, True)
+                rect = (x * self.CELL_SIZE + 1, y * self.CELL_SIZE + 1, 
+                        self.CELL_SIZE - 1, self.CELL_SIZE - 1)
+                surf.fill(color, rect)
+
+        return surf
+
+    def getWellBG(self, color):
+        """Get the pre-rendered BG of the well
+        """
+        bg = self._wellBGs.get(color)
+
+        if bg is None:
+            bg = self._wellBGs[color] = self._makeWellBG(color)
+
+        return bg
+
+    def drawWellBG(self, color):
+        """Draw the BG of the well
+        """
+        self.pgscreen.blit(self.getWellBG(color), self.wellBbox[0])
+
+    def drawWellCells(self, cells):
+        """Draw the given well cells (as made by Well.makeCellsForDrawing()) 
+        with a single fblits()/blits() call. Return the list of their device 
+        rects.
+        """
+        rects = self._wellCellRects
+        surfs = self._cellSurfCache
+
+        blitList = []
+
+        for x, y, color, is_piece in cells:
+            surf = surfs.get(color) or self.getCellSurface(color)
+            blitList.append((surf, rects[y][x]))
+
+        if self.HAVE_FBLITS:
+            self.pgscreen.fblits(blitList)
+        else:
+            self.pgscreen.blits(blitList, doreturn=False)
+
+        return [rect for surf, rect in blitList]
 
     def drawWellContents(self):
         """Draw the contents (piece and shards) of the well
         """
-        for x, y, color, is_piece in self.well.makeCellsForDrawing():
-            self.drawWellCell(x, y, color)
+        self.drawWellCells(self.well.makeCellsForDrawing())
+
+    def drawPage(self, wellBGColor=(40, 40, 40)):
+        """Draw the well and the panels, and update the display. 
+        As long as the same piece keeps falling at the same level, nothing
+        but the piece can change, so we only redraw the piece cells and 
+        update the display where the piece was and where it is now - or 
+        nothing at all, if the piece hasn't moved.
+        """
+        cur = self.well.curPiece
+        state = (cur, self.well.level)
+        pieceXYRot = None if cur is None else (cur.x, cur.y, cur.rot)
+
+        if state != self._drawnState:
+            self._drawnState = state
+            self._drawnPieceXYRot = pieceXYRot
+
+            self.drawWellBG(wellBGColor)
+            self.drawWellContents()
+            self.drawLeftPanel()
+            self.drawRightPanel()
+            self._pieceRects = [
+                self._wellCellRects[y][x] 
+                for x, y, color, is_piece in self.well.makePieceCellsForDrawing()
+            ]
+            self.flipPage()
+            return
+
+        if pieceXYRot == self._drawnPieceXYRot:
+            return
+
+        self._drawnPieceXYRot = pieceXYRot
+
+        # Erase the piece with the matching bits of the BG, there can't be 
+        # any shards under it:
+        bg = self.getWellBG(wellBGColor)
+        orgX, orgY = self.wellBbox[0]
+        
+        dirtyRects = self._pieceRects
+
+        for rect in dirtyRects:
+            self.pgscreen.blit(bg, rect, rect.move(-orgX, -orgY))
+
+        self._pieceRects = self.drawWellCells(
+            self.well.makePieceCellsForDrawing())
+        
+        pygame.display.update(dirtyRects + self._pieceRects)
+
+    def _makeLeftPanelBG(self, bgcolor):
+        """Render the score panel background and the labels into a new surface
+        """
+        surf = self.makeSurface(self.makePyRect(self.leftPanelBbox).size)
+        surf.fill(bgcolor)
+
+        xx = 10
+        yy = 35
+
+        for label in self.LEFT_PANEL_LABELS:
+            textobj = self.smallFont.render(label, True, (200, 200, 200))
+            self.blitText(xx, yy, textobj, surf)
+            yy += 60
+
+        return surf
 
     def drawLeftPanel(self, bgcolor=(50, 50, 50)):
         """Draw the score panel on the left
         """
-        pygame.draw.rect(self.pgscreen, 
-                          bgcolor, 
-                          self.makePyRect(self.leftPanelBbox))
+        bg = self._leftPanelBGs.get(bgcolor)
+
+        if bg is None:
+            bg = self._leftPanelBGs[bgcolor] = self._makeLeftPanelBG(bgcolor)
+
         x, y = self.leftPanelBbox[0]
+        self.pgscreen.blit(bg, (x, y))
 
-        data = (
-            ('Score:', self.well.score),
-            ('Rows:',  self.well.nrows),
-            ('Level:', self.well.level)
-        )
+        # Only render the values when they change:
+        values = (self.well.score, self.well.nrows, self.well.level)
+
+        if values != self._leftPanelValues:
+            self._leftPanelValues = values
+            self._leftPanelValueSurfs = [
+                self.largeFont.render(str(value), True, (255, 120, 80))
+                for value in values
+            ]
         
         xx = x + 10
         yy = y + 35
 
-        for label, value in data:
-            self.drawText(xx, yy, label, (200, 200, 200), self.smallFont)
+        for textobj in self._leftPanelValueSurfs:
             yy += 40
-            self.drawText(xx + 20, yy, str(value), (255, 120, 80), self.largeFont)
+            self.blitText(xx + 20, yy, textobj)
             yy += 20
 
-    def drawRightPanel(self, bgcolor=(50, 50, 50)):
-        pygame.draw.rect(self.pgscreen, 
-                          bgcolor, 
-                          self.makePyRect(self.rightPanelBbox)) 
+    def _makeRightPanel(self, bgcolor):
+        """Render the "next" panel, with the label and the next piece, into 
+        a new surface
+        """
+        surf = self.makeSurface(self.makePyRect(self.rightPanelBbox).size)
+        surf.fill(bgcolor)
 
-        x, y = self.rightPanelBbox[0]
-        label = 'Next:'
-        self.drawText(x+10, y+35, label, (200, 200, 200), self.smallFont)
+        textobj = self.smallFont.render('Next:', True, (200, 200, 200))
+        self.blitText(10, 35, textobj, surf)
 
         # Draw next piece:        
         piece, color = self.well.nextPieceAndColor
+        orgX, orgY = self.rightPanelBbox[0]
 
         for (x, y) in piece.getCellCoords(0, 0, 0):
-            self.drawNextPanelCell(x, y, color)
+            x, y = self.mapNextPanelCoordsToDevice(x, y)
+            surf.blit(self.getCellSurface(color), (x - orgX + 1, y - orgY + 1))
+
+        return surf
+
+    def drawRightPanel(self, bgcolor=(50, 50, 50)):
+        """Draw the "next" panel on the right. It only has to be rendered 
+        again when the next piece changes.
+        """
+        key = (bgcolor, self.well.nextPieceAndColor)
+
+        if key != self._rightPanelKey:
+            self._rightPanelKey = key
+            self._rightPanel = self._makeRightPanel(bgcolor)
+
+        self.pgscreen.blit(self._rightPanel, self.rightPanelBbox[0])
 
     def getUserInput(self):
         result = {
@@ -672,41 +1156,47 @@ class GraphicDevice:
                 result['command'] = 'quit'
                 return result
 
+            if event.type in self.REDRAW_EVENTS:
+                # drawPage() only redraws what has changed since the last
+                # time, make it start over:
+                self.initPage()
+                continue
+
             # For state toggle keys it's easier to treat them as "text" events:
             if event.type == pygame.TEXTINPUT and event.text.lower() == 'p':
                 result['command'] = 'pause'
-                return result
+                continue
 
             if event.type == pygame.KEYDOWN:
                 key = event.key
 
                 if key == pygame.K_SPACE:
                     result['free_fall'] = True
-                    result['dx'] = result['drot'] = 0
-                    return result
-                
-                elif key == pygame.K_KP_PLUS:
-                    result['dlevel'] += 1
-                elif key == pygame.K_KP_MINUS:
-                    result['dlevel'] -= 1
-                else:
-                    if key in (pygame.K_LEFT, pygame.K_a):
-                        result['dx'] -= 1
-                    if key in (pygame.K_RIGHT, pygame.K_d):
-                        result['dx'] += 1
-                    if key in (pygame.K_UP, pygame.K_w):
-                        result['drot'] -= 1
-                    if key in (pygame.K_DOWN, pygame.K_s):
-                        result['drot'] += 1
+                    continue
+
+                deltas = self.KEY_DELTAS.get(key)
+
+                if deltas:
+                    dx, drot, dlevel = deltas
+                    result['dx'] += dx
+                    result['drot'] += drot
+                    result['dlevel'] += dlevel
+
+        if result['free_fall']:
+            # The piece is dropped as it is, no more moving or rotating:
+            result['dx'] = result['drot'] = 0
 
         return result
 
 class Game:
+    FRAME_RATE = 60
+
     def __init__(self):
         """Create the draw manager, initialize the screen for drawing
         """
         self.well = Well()
         self.gdevice = GraphicDevice(self.well)
+        self.clock = pygame.time.Clock()
         self.reset()
 
     def reset(self):
@@ -721,23 +1211,40 @@ class Game:
     def loop(self):
         """Run this until the user asks to quit
         """
+        # The objects and methods we use every frame, looked up once:
+        well = self.well
+        gdevice = self.gdevice
+        advance = well.advance
+        tick = self.clock.tick
+        frameRate = self.FRAME_RATE
+
+        # ...and the constants:
+        hitShards = Well.HIT_SHARDS
+        gameOver = Well.GAME_OVER
+        landed = (Well.HIT_BOTTOM, Well.HIT_SHARDS)
+
         # Fill the background:
-        self.gdevice.initPage()
+        gdevice.initPage()
 
         freeFalling = False
         pause = False
-        t = time.time()
+        # Game time accumulated towards the next fall of the piece, in secs,
+        # and the fall period, recalculated whenever the level changes:
+        fallTime = 0
+        fallPeriod = None
+        level = None
+        tick()
 
         while True:
-            self.gdevice.drawWellBG((40, 40, 40))
-            self.gdevice.drawLeftPanel()
-            self.gdevice.drawRightPanel()
+            # Don't run more often than we need to, and find out how much time 
+            # has passed since the previous frame:
+            frameTime = tick(frameRate) / 1000
 
             dx = 0
             drot = 0
             lastEvent = None
             
-            userInput = self.gdevice.getUserInput()
+            userInput = gdevice.getUserInput()
 
             if userInput['command'] == 'quit':
                 return 'quit'
@@ -746,9 +1253,13 @@ class Game:
                 pause = not pause
 
             if pause:
+                # Nothing changes, but the page may need a redraw:
+                gdevice.drawPage((40, 40, 40))
                 time.sleep(0.5)
                 continue
 
+            fallTime += frameTime
+
             freeFalling += userInput['free_fall']
 
             dx += userInput['dx']
@@ -757,54 +1268,55 @@ class Game:
             dlevel = userInput['dlevel']
 
             if dlevel > 0:
-                self.well.level += dlevel
+                well.level += dlevel
             elif dlevel < 0:
-                self.well.level = max(1, self.well.level - 1)
+                well.level = max(1, well.level - 1)
 
             # Check 1: make sure we can rotate the piece. If we hit a side after
             # that, we try moving the piece sideways by 1 or 2 cells:
-            hit = self.well.checkCollision(0, 0, drot)
+            hit = well.tryKick(drot)
 
-            if hit == Well.HIT_SHARDS:
-                lastEvent = Well.GAME_OVER
+            if hit == hitShards:
+                lastEvent = gameOver
             else:
-                if hit == Well.HIT_LEFT_SIDE:
-                    for i in range(1, 3, 1):
-                        # Bounce, until we are withing the well:
-                        if self.well.advance(i, 0, drot) != Well.HIT_LEFT_SIDE:
-                            break
-                elif hit == Well.HIT_RIGHT_SIDE:
-                    for i in range(1, 3, 1):
-                        # Bounce, until we are withing the well:
-                        if self.well.advance(-i, 0, drot) != Well.HIT_RIGHT_SIDE:
-                            break
-                else:
-                    self.well.advance(0, 0, drot)
+                if well.curPiece is None:
+                    # Nothing is falling, drop the next piece in:
+                    advance(0, 0, 0)
      
                 # Check 2: only consider moving sideways:
                 # Even if we hit something here, it should not cause sharding
                 # of the piece!
-                lastEvent = self.well.advance(dx, 0, 0)
+                lastEvent = advance(dx, 0, 0)
                         
-                if lastEvent == Well.GAME_OVER:
+                if lastEvent == gameOver:
                     # Nothing really to do here...
                     pass
                 else:
-                    # Check 2: apply dy=1
-                    if freeFalling or time.time() > t + self.fallPeriod:
-                        t = time.time()
-                        lastEvent = self.well.advance(dx=0, dy=1, drot=0)
-
-                        if lastEvent in (Well.HIT_BOTTOM, Well.HIT_SHARDS):
+                    # Check 2: apply dy=1 once per fall period (catching up 
+                    # if the frame took longer than that), or once per frame 
+                    # when free falling:
+                    if well.level != level:
+                        level = well.level
+                        fallPeriod = max(self.fallPeriod, 1 / frameRate)
+                    
+                    if freeFalling:
+                        fallTime = max(fallTime, fallPeriod)
+
+                    while fallTime >= fallPeriod:
+                        fallTime -= fallPeriod
+                        lastEvent = advance(dx=0, dy=1, drot=0)
+
+                        if lastEvent in landed:
                             freeFalling = False
-                
-            self.gdevice.drawWellContents()
-            self.gdevice.drawLeftPanel()
+                            break
 
-            # Flip the display page
-            self.gdevice.flipPage()
+                        if lastEvent == gameOver:
+                            break
+                
+            # Draw everything once, after the well has advanced:
+            gdevice.drawPage((40, 40, 40))
 
-            if lastEvent == Well.GAME_OVER:
+            if lastEvent == gameOver:
                 return lastEvent
 
     def close(self):
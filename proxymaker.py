@@ -23,6 +23,9 @@ import math
 import subprocess
 import logging
 import optparse
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 # target format:
 PROXY_SIZE = (1080, 720)
@@ -33,11 +36,81 @@ CRF = 20  # Constant Rate Factor
           # but the larger the file size.
           # 0 == lossless, 51 == the worst, 23 == ffmpeg default
 
-VIDEO_EXTS = ('.mov', '.mp4', '.mks',) 
+# Video encoder: x264 runs on the CPU, the rest of them use the dedicated
+# encoding hardware of the GPU, which is many times faster:
+ENCODER = 'x264'
+VAAPI_DEVICE = '/dev/dri/renderD128'
+
+# NVENC speed/quality preset (p1 == the fastest ... p7 == the best quality)
+# and tuning (hq == high quality, ll == low latency, ull == ultra low latency):
+NVENC_PRESET = 'p5'
+NVENC_TUNE = 'hq'
+
+# codec: ffmpeg video codec, decodeArgs/encodeArgs: decoding/encoding options,
+# qualityOpt: quality option, scaleFilter: scale filter or None for -s.
+Encoder = collections.namedtuple('Encoder', 'codec decodeArgs encodeArgs '
+                                            'qualityOpt scaleFilter')
+
+# The hardware encoders keep the decoded frames in the GPU memory and scale
+# them there, so the frames never travel to the host memory and back:
+ENCODERS = {
+    'x264':  Encoder(VIDEO_CODEC, ['-hwaccel', 'dxva2'], [], '-crf', None),
+    'nvenc': Encoder('h264_nvenc', ['-hwaccel', 'cuda',
+                                    '-hwaccel_output_format', 'cuda'],
+                     # variable bit rate driven by -cq only, with the
+                     # lookahead and adaptive quantization done by the
+                     # encoder at no speed cost:
+                     ['-rc', 'vbr', '-b:v', '0', '-rc-lookahead', '20',
+                      '-spatial_aq', '1', '-temporal_aq', '1',
+                      '-multipass', 'qres'], '-cq',
+                     'scale_cuda=%d:%d:format=nv12'),
+    'qsv':   Encoder('h264_qsv', ['-hwaccel', 'qsv',
+                                  '-hwaccel_output_format', 'qsv'], [],
+                     '-global_quality', 'scale_qsv=%d:%d'),
+    'vaapi': Encoder('h264_vaapi', ['-hwaccel', 'vaapi',
+                                    '-vaapi_device', VAAPI_DEVICE,
+                                    '-hwaccel_output_format', 'vaapi'], [], '-qp',
+                     'format=nv12|vaapi,hwupload,scale_vaapi=%d:%d'),
+    # videotoolbox has no quality scale matching CRF, so it goes with
+    # its default bit rate. scale_vt needs ffmpeg 7.0 or newer:
+    'vt':    Encoder('h264_videotoolbox', ['-hwaccel', 'videotoolbox',
+                                           '-hwaccel_output_format', 'videotoolbox_vld'],
+                     [], None, 'scale_vt=%d:%d'),
+}
+
+# The GPU can't decode some of the sources (e.g. ProRes or DNxHD), and the
+# hardware scale filters can't take the software decoded frames. Then the
+# frames are decoded and scaled on the CPU, and only encoded on the GPU.
+# encoder: (decoding options, scale filter or None for -s):
+SOFTWARE_DECODING = {
+    'vaapi': (['-vaapi_device', VAAPI_DEVICE],
+              'scale=%d:%d,format=nv12,hwupload'),
+}
+
+VIDEO_EXTS = ('.mov', '.mp4', '.mks',)
 ONLY_OVERWRITE_IF_NEWER = False
 
 DEST_DIR_PREFIX = 'proxy.'
 
+# Existing proxies are only skipped if their duration matches the source
+# within this many seconds, otherwise they are leftovers of a failed run:
+DURATION_TOLERANCE = 0.5
+
+# A single ffmpeg process can't keep all the cores of a big machine busy,
+# so we run a few of them at once, each one with its share of the cores:
+THREADS_PER_JOB = 4
+JOBS = max(1, multiprocessing.cpu_count() // THREADS_PER_JOB)
+
+# The hardware encoders are not limited by the cores but by the encoding
+# sessions the GPU allows at once (only a few on the consumer NVENC cards),
+# so unless --jobs is given they don't get more jobs than this:
+MAX_ENCODER_JOBS = {
+    'nvenc': 2,
+    'qsv':   2,
+    'vaapi': 2,
+    'vt':    2,
+}
+
 log = logging.getLogger(os.path.splitext(os.path.basename(sys.argv[0]))[0])
 log.setLevel(logging.DEBUG)
 ch = logging.StreamHandler()
@@ -46,26 +119,157 @@ formatter = logging.Formatter('%(asctime)s %(name)s: [%(levelname)s] %(message)s
 ch.setFormatter(formatter)
 log.addHandler(ch)
 
-def makeTranscodeCmdLine(src, dst, exe='ffmpeg'):
+_encoders = {}
+
+def getEncoders(exe='ffmpeg'):
+    """Return a set of the video encoder names supported by the ffmpeg
+    executable, or None if it can't be asked. The result is cached.
+    """
+    if exe not in _encoders:
+        try:
+            output = subprocess.check_output([exe, '-hide_banner', '-encoders'],
+                                             universal_newlines=True)
+        except Exception, e:
+            log.warning('%s: failed to list the encoders: %s' % (exe, e))
+            _encoders[exe] = None
+        else:
+            # lines like " V....D h264_nvenc   NVIDIA NVENC H.264 encoder":
+            _encoders[exe] = set(fields[1] for fields in
+                                 (line.split() for line in output.splitlines())
+                                 if len(fields) > 1 and
+                                    fields[0].startswith('V'))
+    return _encoders[exe]
+
+def getStat(path):
+    """Return os.stat() of the path, or None if there is no such file.
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+def getDuration(path, exe='ffprobe'):
+    """Return the duration of a video file in seconds, as reported by
+    ffprobe, or None if it can't be found out.
+    """
+    cmd = [exe, '-v', 'error', '-show_entries', 'format=duration',
+           '-of', 'default=noprint_wrappers=1:nokey=1', path]
+    try:
+        return float(subprocess.check_output(cmd, universal_newlines=True))
+    except Exception, e:
+        log.debug('%s: failed to get the duration: %s' % (path, e))
+        return None
+
+def isProxyComplete(files):
+    """Return True unless the duration of a (src, dst) proxy file differs
+    from the source. If the source duration is unknown there is nothing to
+    compare it with, so the proxy is considered complete.
+    """
+    srcFile, dstFile = files
+    srcDuration = getDuration(srcFile)
+    
+    if srcDuration is None:
+        return True
+    
+    dstDuration = getDuration(dstFile)
+    return dstDuration is not None and \
+           abs(srcDuration - dstDuration) < DURATION_TOLERANCE
+
+def parallelMap(func, items):
+    """Same as map(), but runs func on up to JOBS items at once. Return a
+    list of the results.
+    """
+    if JOBS <= 1 or len(items) <= 1:
+        return list(map(func, items))
+
+    # The threads just wait for their ffmpeg processes, so the GIL is no
+    # problem here:
+    pool = ThreadPool(min(JOBS, len(items)))
+    
+    try:
+        # pool.map() blocks Ctrl+C until all the items are done, a get()
+        # with a timeout lets it through:
+        result = pool.map_async(func, items).get(sys.maxint)
+    except:
+        # Ctrl+C or an aborted job, don't start any more of them:
+        pool.terminate()
+        pool.join()
+        raise
+    
+    pool.close()
+    pool.join()
+    return result
+
+def makeTranscodeCmdLine(src, dst, exe='ffmpeg', threads=0, hwDecoding=True):
     """Make a list of strings: ffmpeg command line for video/audio transcoding.
+    threads=0 lets ffmpeg pick the number of threads itself. hwDecoding=False
+    makes the hardware encoders decode and scale on the CPU.
     """
+    codec, decodeArgs, encodeArgs, qualityOpt, scaleFilter = ENCODERS[ENCODER]
+
+    if not hwDecoding and scaleFilter:
+        decodeArgs, scaleFilter = SOFTWARE_DECODING.get(ENCODER, ([], None))
+    
     result = [exe]
-    result.extend(['-hwaccel', 'dxva2'])
+    # Only report the errors: no progress stats, nothing read from stdin:
+    result.extend(['-nostdin', '-nostats', '-loglevel', 'error', '-hide_banner'])
+    result.extend(decodeArgs)
     result.extend(['-i', src])
-    result.extend(['-c:v', VIDEO_CODEC])
+    result.extend(['-c:v', codec])
+    result.extend(encodeArgs)
+    
+    if ENCODER == 'nvenc':
+        result.extend(['-preset', NVENC_PRESET, '-tune', NVENC_TUNE])
+        
     result.extend(['-c:a', AUDIO_CODEC])
-    result.extend(['-crf', str(CRF)])
-    result.extend(['-s', '%dx%d' % PROXY_SIZE])
-    result.extend(['-y', '-threads', '0'])
+    
+    if qualityOpt:
+        result.extend([qualityOpt, str(CRF)])
+    
+    if scaleFilter:
+        result.extend(['-vf', scaleFilter % PROXY_SIZE])
+    else:
+        result.extend(['-s', '%dx%d' % PROXY_SIZE])
+        
+    result.extend(['-y', '-threads', str(threads)])
     result.append(dst)
     return result
 
-def transcode(src, dst, dryRun=False):
+class TranscodeAborted(subprocess.CalledProcessError):
+    """ffmpeg has been interrupted or killed, this stops the whole run
+    rather than just the current file.
+    """
+
+def runQuietly(cmd, src):
+    """Run an ffmpeg command line off the terminal, log the errors it reports
+    for the src file. Raise CalledProcessError if it fails, TranscodeAborted
+    if it has been interrupted.
+    """
+    # Keep ffmpeg off the terminal, the parallel jobs would fight over it.
+    # Whatever errors it reports go to the log:
+    with open(os.devnull, 'r+b') as devnull:
+        proc = subprocess.Popen(cmd, stdin=devnull, stdout=devnull,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        errors = proc.communicate()[1].strip()
+    
+    if errors:
+        log.warning('%s: %s' % (src, errors))
+        
+    # ffmpeg exits with 255 when interrupted (e.g. by Ctrl+C), a negative
+    # return code means it has been killed by a signal:
+    if proc.returncode < 0 or proc.returncode == 255:
+        raise TranscodeAborted(proc.returncode, cmd)
+    
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+def transcode(src, dst, dryRun=False, threads=0):
     """Run the command for video/audio transcoding.
     """
     log.info('*** Transcoding %s... ***' % src)
     
-    cmd = makeTranscodeCmdLine(src, dst)
+    cmd = makeTranscodeCmdLine(src, dst, threads=threads)
 
     log.debug('command: ' + ' '.join(cmd))
     
@@ -73,7 +277,23 @@ def transcode(src, dst, dryRun=False):
         return
         
     try:
-        subprocess.check_call(cmd)
+        try:
+            runQuietly(cmd, src)
+        except TranscodeAborted:
+            # not a decoding failure, there is nothing to retry:
+            raise
+        except subprocess.CalledProcessError:
+            if not ENCODERS[ENCODER].scaleFilter:
+                raise
+
+            # No hardware scaling without the hardware decoding, see
+            # SOFTWARE_DECODING:
+            log.warning('%s: transcoding on the GPU failed, retrying with '
+                        'the decoding and scaling on the CPU' % src)
+            cmd = makeTranscodeCmdLine(src, dst, threads=threads,
+                                       hwDecoding=False)
+            log.debug('command: ' + ' '.join(cmd))
+            runQuietly(cmd, src)
     except:
         if os.path.exists(dst):
             # partially saved files should be deleted!
@@ -81,61 +301,117 @@ def transcode(src, dst, dryRun=False):
             log.warning('%s: partially saved file deleted!' % dst)
         raise
             
-    if not os.path.exists(dst) or os.path.getsize(dst) == 0:
+    dstStat = getStat(dst)
+    
+    if not dstStat or dstStat.st_size == 0:
         raise ValueError('%s: destination file not found or empty after transcoding' % dst)
+
+def transcodeJob(job):
+    """Transcode a single (src, dst, dryRun) job, log the result.
+    Return 1 if the proxy has been made, 0 otherwise. This runs in the
+    worker threads, so it only raises TranscodeAborted, to stop them all.
+    """
+    srcFile, dstFile, dryRun = job
+
+    # Split the cores between the jobs running at once:
+    threads = 0 if JOBS <= 1 else \
+              max(1, multiprocessing.cpu_count() // JOBS)
+    
+    try:
+        transcode(srcFile, dstFile, dryRun, threads=threads)
+    except TranscodeAborted:
+        raise
+    except Exception, e:
+        log.warning('%s: %s' % (srcFile, e))
+        return 0
+
+    dstStat = getStat(dstFile)
+    
+    if dstStat and dstStat.st_size > 0:
+        compression = float(os.path.getsize(srcFile)) / dstStat.st_size
+        log.info('%s: done. Compression ratio: %02f' % \
+                 (dstFile, compression))
+        return 1
+
+    return 0
     
+def iterVideoFiles(dir):
+    """Recursively yield (directory, file name) for all video files inside
+    a folder and all of its subfolders, except for the proxy directories.
+    """
+    for root, dirs, files in os.walk(dir):
+        # Prune the proxy directories in place, so os.walk skips them:
+        dirs[:] = [x for x in dirs if not x.startswith(DEST_DIR_PREFIX)]
+        
+        for f in files:
+            if os.path.splitext(f)[1].lower() in VIDEO_EXTS:
+                yield root, f
+
 def transcodeFolder(dir, dryRun=False):
     """Recursively find and transcode all video files inside a folder and
     all of its subfolders. Save transcoded files in a subdirectory next to each file,
-    named "proxy.XXXXxYYYY"
+    named "proxy.XXXXxYYYY". Up to JOBS files are transcoded at once.
     Return # of files found and transcoded.
     """
-    result = 0
+    jobs = []
+    outDirs = set()
+    # existing proxies newer than the sources, (src, dst, compression):
+    newer = []
     
     if not os.path.isabs(dir):
         dir = os.path.abspath(dir)
 
     destDirName = '%s%dx%d' % (DEST_DIR_PREFIX, PROXY_SIZE[0], PROXY_SIZE[1])
         
-    for root, dirs, files in os.walk(dir):
-        while dirs and dirs[0].startswith(DEST_DIR_PREFIX):
-            dirs.pop(0)
-        
+    for root, f in iterVideoFiles(dir):
         outDir = os.path.join(root, destDirName)
-        
-        for f in files:
-            if os.path.splitext(f)[1].lower() not in VIDEO_EXTS:
-                continue
+        srcFile = os.path.join(root, f)
+        dstFile = os.path.join(outDir, f)
+
+        if ONLY_OVERWRITE_IF_NEWER:
+            # one stat() per file, these may well be on a NAS:
+            dstStat = getStat(dstFile)
             
-            srcFile = os.path.join(root, f)
-            dstFile = os.path.join(outDir, f)
-
-            if ONLY_OVERWRITE_IF_NEWER and \
-               os.path.exists(dstFile) and \
-               os.path.getsize(dstFile) > 0 and \
-               os.path.getmtime(dstFile) >= os.path.getmtime(srcFile):
-                compression = float(os.path.getsize(srcFile)) / os.path.getsize(dstFile)
-                log.info('Skipping %s: newer than the source. '
-                         'Compression ratio: %02f' % (dstFile, compression))
-                continue
+            if dstStat and dstStat.st_size > 0:
+                srcStat = os.stat(srcFile)
                 
-            if not dryRun and not os.path.exists(outDir):
-                os.makedirs(outDir)
+                if dstStat.st_mtime >= srcStat.st_mtime:
+                    compression = float(srcStat.st_size) / dstStat.st_size
+                    newer.append((srcFile, dstFile, compression))
+                    continue
             
+        outDirs.add(outDir)
+        jobs.append((srcFile, dstFile, dryRun))
+
+    # Probe the newer proxies (in parallel, ffprobe has to read them) and
+    # only skip the complete ones. A dry run doesn't touch the files, it
+    # goes by the modification times alone:
+    if dryRun:
+        complete = [True] * len(newer)
+    else:
+        complete = parallelMap(isProxyComplete, [x[:2] for x in newer])
+    
+    for (srcFile, dstFile, compression), isComplete in zip(newer, complete):
+        if isComplete:
+            log.info('Skipping %s: newer than the source. '
+                     'Compression ratio: %02f' % (dstFile, compression))
+        else:
+            log.info('%s: duration differs from the source, '
+                     'transcoding again' % dstFile)
+            outDirs.add(os.path.dirname(dstFile))
+            jobs.append((srcFile, dstFile, dryRun))
+
+    # one makedirs per output directory rather than an exists() probe
+    # per file:
+    if not dryRun:
+        for outDir in sorted(outDirs):
             try:
-                transcode(srcFile, dstFile, dryRun)
-            except Exception, e:
-                log.warning('%s: %e' % (srcFile, e))
-            else:
-                if os.path.exists(dstFile) and \
-                   os.path.getsize(dstFile) > 0:
-                    compression = float(os.path.getsize(srcFile)) / \
-                                  os.path.getsize(dstFile)
-                    log.info('%s: done. Compression ratio: %02f' % \
-                             (dstFile, compression))
-                    result += 1
-                
-    return result
+                os.makedirs(outDir)
+            except OSError:
+                if not os.path.isdir(outDir):
+                    raise
+
+    return sum(parallelMap(transcodeJob, jobs))
 
 if __name__ == '__main__':
     parser = optparse.OptionParser()
@@ -151,10 +427,31 @@ if __name__ == '__main__':
     parser.add_option('-c', '--crf', dest='crf',
                       action='store', default=CRF, type='int',
                       help='Constand Bit Factor, default: %d' % CRF)
+    parser.add_option('-e', '--encoder', dest='encoder',
+                      action='store', default=ENCODER, type='choice',
+                      choices=sorted(ENCODERS),
+                      help='video encoder: %s, default: %s' % \
+                           (', '.join(sorted(ENCODERS)), ENCODER))
+    parser.add_option('-p', '--preset', dest='preset',
+                      action='store', default=NVENC_PRESET, type='choice',
+                      choices=['p%d' % x for x in range(1, 8)],
+                      help='nvenc preset: p1 (fastest) to p7 (best quality), '
+                           'default: %s' % NVENC_PRESET)
+    parser.add_option('-t', '--tune', dest='tune',
+                      action='store', default=NVENC_TUNE, type='choice',
+                      choices=['hq', 'll', 'ull'],
+                      help='nvenc tuning: hq, ll or ull, default: %s' % \
+                           NVENC_TUNE)
+    parser.add_option('-j', '--jobs', dest='jobs',
+                      action='store', default=None, type='int',
+                      help='number of files to transcode at once, '
+                           'default: %d (at most %d with a hardware encoder)' % \
+                           (JOBS, max(MAX_ENCODER_JOBS.values())))
     parser.add_option('-n', '--newer', dest='newer',
                       action='store_true', default=ONLY_OVERWRITE_IF_NEWER,
                       help='skip existing destination files in case they '
-                           'are newer than the sources, default: %s' % \
+                           'are newer than the sources and have the same '
+                           'duration (not probed in a dry run), default: %s' % \
                            ONLY_OVERWRITE_IF_NEWER)
 
     options, args = parser.parse_args()
@@ -162,9 +459,27 @@ if __name__ == '__main__':
     PROXY_SIZE = options.proxy_size
     CRF = options.crf
     ONLY_OVERWRITE_IF_NEWER = options.newer
+    ENCODER = options.encoder
+    NVENC_PRESET = options.preset
+    NVENC_TUNE = options.tune
         
     if not args:
         raise ValueError('No directories specified')
+
+    encoders = getEncoders()
+    
+    if encoders is not None and ENCODERS[ENCODER].codec not in encoders:
+        supported = sorted(name for name, encoder in ENCODERS.items()
+                           if encoder.codec in encoders)
+        log.warning('%s is not supported by this ffmpeg, using --encoder x264 '
+                    'instead. Choose one of --encoder %s' % \
+                    (ENCODERS[ENCODER].codec, ', '.join(supported)))
+        ENCODER = 'x264'
+
+    if options.jobs is not None:
+        JOBS = options.jobs
+    else:
+        JOBS = min(JOBS, MAX_ENCODER_JOBS.get(ENCODER, JOBS))
         
     fileCount = 0
     
@@ -174,6 +489,9 @@ if __name__ == '__main__':
             
         try:
             fileCount += transcodeFolder(dir, dryRun=options.dry_run)
+        except (KeyboardInterrupt, TranscodeAborted):
+            log.warning('Interrupted. %d file(s) transcoded' % fileCount)
+            sys.exit(1)
         except Exception, e:
             log.warning('%s: %s' % (dir, e))
             
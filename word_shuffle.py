@@ -35,17 +35,28 @@ difficult to read. To make an easy to read jumbled word you should
 therefore avoid making other words.
 """
 
+# Leading and trailing chars which stay in place:
+PUNCTUATION = '.,!?`~:;-+/"\'<>[](){}'
+
+# Splits a text into words, keeps the whitespace in between:
+WHITESPACE_REGEX = re.compile(r'(\s+)', re.UNICODE)
+
+# Big inputs are read, processed and written in batches of this many chars:
+BATCH_SIZE = 65536
+
 def shuffle_chars(s):
     """Randomly shuffle characters in a string and return a new string
     """
     assert(len(s) >= 2)
 
+    # Nothing to shuffle if all the chars are the same:
+    if s.count(s[0]) == len(s):
+        return s
+
     result = s
 
     while result == s:
-        pairs = [(x, random.random()) for x in s]
-        pairs.sort(cmp=lambda *arg: cmp(arg[0][1], arg[1][1]))
-        result = ''.join([x[0] for x in pairs])
+        result = ''.join(random.sample(s, len(s)))
 
     return result
 
@@ -53,62 +64,50 @@ def shuffle_word(w):
     """Keep first and last chars and shuffle the ones in between.
     Also preserve leading and trailing punctuation chars.
     """
-    PUNCTUATION = '.,!?`~:;-+/"\'<>[](){}'
-    pre = ''
-    suf = ''
-    mid = w
-
     # Strip the punctuation off both sides:
-    while mid and mid[0] in PUNCTUATION:
-        pre += mid[0]
-        mid = mid[1:]
-
-    while mid and mid[-1] in PUNCTUATION:
-        suf += mid[-1]
-        mid = mid[:-1]
+    mid = w.strip(PUNCTUATION)
 
     # If the stripped part is 3 chars or shorter,
     # we would not be able to shuffle the middle:
     if len(mid) <= 3:
         return w
 
-    # Strip the first and last and shuffle the middle:
-    pre += mid[0]
-    suf = mid[-1] + suf
+    # Keep the first and last chars along with the punctuation
+    # and shuffle the middle:
+    start = len(w) - len(w.lstrip(PUNCTUATION))
+    pre = w[:start + 1]
+    suf = w[start + len(mid) - 1:]
     mid = mid[1:-1]
 
     # Now join all the parts back together:
     return pre + shuffle_chars(mid) + suf
 
 
-def shuffle_line(s):
-    """Process a line of text
+def shuffle_text(s):
+    """Process a text: shuffle the words, keep the whitespace between them
+    as it is
     """
-    newWords = []
+    tokens = WHITESPACE_REGEX.split(s)
 
-    for word in s.split(' '):
-        # Skip numbers and short strings:
-        if word.isdigit() or len(word) <= 3:
-            newWords.append(word)
-        else:
-            # Process the word by keeping the first and the last chars
-            # and shuffling the ones in between:
-            newWords.append(shuffle_word(word))
+    # The even tokens are the words, the odd ones are the whitespace.
+    # Skip numbers and short strings, process the rest by keeping the first
+    # and the last chars and shuffling the ones in between:
+    tokens[::2] = [shuffle_word(x) if len(x) > 3 and not x.isdigit() else x
+                   for x in tokens[::2]]
 
-    return ' '.join(newWords)
+    return ''.join(tokens)
 
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        text = DEFAULT_TEXT.splitlines()
-    elif sys.argv[1] == '-':
-        text = sys.stdin.readlines()
+        batches = [DEFAULT_TEXT]
     else:
-        text = file(sys.argv[1]).readlines()
-
-    text = [x.decode('utf-8') for x in text]
+        f = sys.stdin if sys.argv[1] == '-' else file(sys.argv[1])
+        # Whole lines of about BATCH_SIZE chars at a time, until the end:
+        batches = iter(lambda: ''.join(f.readlines(BATCH_SIZE)), '')
 
     sys.stderr.write('Output:\n')
 
-    for line in text:
-        print shuffle_line(line.rstrip())
+    # A single write per batch, however many lines it has:
+    for text in batches:
+        sys.stdout.write(shuffle_text(text.decode('utf-8')).encode('utf-8'))
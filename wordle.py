@@ -8,6 +8,7 @@ the characters on every step of the game.
 import os
 import sys
 import re
+import mmap
 
 import logging
 logging.basicConfig(level=os.environ.get('LOGLEVEL', 'INFO'))
@@ -16,10 +17,64 @@ log = logging.getLogger('wordle.py')
 WORD_LEN = 5
 WORD_FILE = '/usr/share/dict/words'
 AZ_REGEX = re.compile('[a-z]')
+# A whole line of the word file with a good word, surrounding blanks allowed:
+WORD_LINE_REGEX = re.compile(rb'(?m)^[ \t\r]*([a-z]{%d})[ \t\r]*$' % WORD_LEN)
 
 class WordFinder(object):
+    # The word list is shared by all the instances, it's read only once.
+    # positionIndex is a lookup table per position: char -> int with a bit
+    # set for every word having that char there (bit 0 for words[0], bit 1
+    # for words[1] etc.), charIndex is the same for the char anywhere in the
+    # word. positionalBitsCache keeps the recent getPositionalBits() results:
     words = None
+    positionIndex = None
+    charIndex = None
+    positionalBitsCache = {}
+    POSITIONAL_BITS_CACHE_SIZE = 128
+
+    @classmethod
+    def loadWords(cls):
+        """Read the word file, but only keep 5-letter words that only contain
+        lowercase letters. Do nothing if the words are already loaded.
+        """
+        if cls.words is None:
+            with open(WORD_FILE, 'rb') as f:
+                if not os.fstat(f.fileno()).st_size:
+                    # mmap can't map an empty file:
+                    cls.words = ()
+                else:
+                    # Let the regex engine sweep the whole file in one go:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        found = WORD_LINE_REGEX.findall(mm)
+                    # Decode all the words at once rather than one by one:
+                    cls.words = tuple(b'\n'.join(found).decode('ascii').split())
+
+            # OR-ing the bits into a growing int word by word would copy it
+            # every time. Instead, take a column of chars at a position,
+            # translate it into '1' where the char is and '0' elsewhere and
+            # parse that as a binary number, all of it done in C:
+            allWords = ''.join(cls.words).encode('ascii')
+            cls.positionIndex = []
+            cls.charIndex = {}
+
+            for pos in range(WORD_LEN):
+                column = allWords[pos::WORD_LEN]
+                index = {}
+
+                for char in set(column):
+                    table = bytearray(b'0' * 256)
+                    table[char] = ord('1')
+                    # Bit 0 goes last in the binary number:
+                    index[chr(char)] = int(column.translate(table)[::-1], 2)
+                    
+                cls.positionIndex.append(index)
+
+                for char, bits in index.items():
+                    cls.charIndex[char] = cls.charIndex.get(char, 0) | bits
 
+            # The cached bits belong to the previous words:
+            cls.positionalBitsCache.clear()
+            
     def __init__(self):
         """Create the object
         """
@@ -31,16 +86,7 @@ class WordFinder(object):
         # to store multiple characters per each position:
         self.yellowChars = [set() for x in range(WORD_LEN)]
 
-        if not self.words:
-            # Read the word file, but only keep 5-letter words that only contain 
-            # lowercase letters:
-            self.words = []
-            regex = re.compile('^' + '[a-z]' * WORD_LEN + '$')
-            
-            for line in open(WORD_FILE):
-                line = line.strip()
-                if regex.match(line):
-                    self.words.append(line)
+        self.loadWords()
 
     def addGreenChar(self, char, pos):
         """Add a green char at a specified position.
@@ -79,6 +125,37 @@ class WordFinder(object):
 
             self.greyCharSet.add(char)
 
+    @classmethod
+    def getPositionalBits(cls, greenChars, yellowChars):
+        """Return an int with a bit set for every word matching the green
+        chars (a string per position, empty if unknown) and the yellow chars
+        (a string of chars per position). The results are cached, so a
+        repeated query doesn't look them up again.
+        """
+        key = (greenChars, yellowChars)
+        
+        if key in cls.positionalBitsCache:
+            return cls.positionalBitsCache[key]
+
+        if len(cls.positionalBitsCache) >= cls.POSITIONAL_BITS_CACHE_SIZE:
+            cls.positionalBitsCache.clear()
+
+        # Start with all the words and AND the lookup table bits in, so the
+        # whole word list is filtered by a few big int operations:
+        bits = (1 << len(cls.words)) - 1
+
+        for index, green, yellow in zip(cls.positionIndex, greenChars,
+                                        yellowChars):
+            # Exclude characters at the yellow positions:
+            for char in yellow:
+                bits &= ~index.get(char, 0)
+            # Only include words with characters in green positions:
+            if green:
+                bits &= index.get(green, 0)
+
+        cls.positionalBitsCache[key] = bits
+        return bits
+
     def findMatchingWords(self):
         """Filter the word list and return the ones that match the previously
         specified criteria.
@@ -86,59 +163,26 @@ class WordFinder(object):
         log.debug('Initial set: {} words'.format(len(self.words)))
 
         # We need a set of all yellow and green characters:
-        allYellowAndGreenChars = set()
-
-        # Prepare a regex to exclude characters at the yellow positions:
-        yellowExcludeParts = []
-        
-        for i, chars in enumerate(self.yellowChars):
-            allYellowAndGreenChars.update(chars)
-            if not chars:
-                continue
-            yellowExcludeParts.append('.'*i + 
-                         '[' + ''.join(chars) + ']' + 
-                         '.'*(WORD_LEN-i-1))
-        yellowExcludeRegex = '|'.join(yellowExcludeParts)
+        allYellowAndGreenChars = set(x for x in self.greenChars if x)
+        allYellowAndGreenChars.update(*self.yellowChars)
+
+        bits = self.getPositionalBits(tuple(self.greenChars),
+                                      tuple(''.join(sorted(x))
+                                            for x in self.yellowChars))
+
+        # Exclude words with grey characters, and the word can only be
+        # considered "good" if all yellow and green characters are present
+        # in it:
+        for char in self.greyCharSet:
+            bits &= ~self.charIndex.get(char, 0)
+            
+        for char in allYellowAndGreenChars:
+            bits &= self.charIndex.get(char, 0)
 
-        allYellowAndGreenChars.update([x for x in self.greenChars if x])
-        
-        # Prepare a regex to only include words with characters in green positions: 
-        greenIncludeRegex = ''.join([(x or '.') for x in self.greenChars])
-
-        # Prepare a regex to exclude words with grey characters: 
-        greyExcludeRegex = '[' + ''.join(self.greyCharSet) + ']'
-
-        log.debug('greyExcludeRegex: {}'.format(repr(greyExcludeRegex)))
-        log.debug('yellowExcludeRegex: {}'.format(repr(yellowExcludeRegex)))
-        log.debug('greenIncludeRegex: {}'.format(repr(greenIncludeRegex))) 
-        log.debug('allYellowAndGreenChars: {}'.format(repr(allYellowAndGreenChars))) 
-
-        greyExcludeRegex = None if greyExcludeRegex == '[]' \
-                           else re.compile(greyExcludeRegex)
-        yellowExcludeRegex = re.compile(yellowExcludeRegex) if yellowExcludeRegex \
-                             else None
-        greenIncludeRegex = re.compile(greenIncludeRegex)
-
-        result = list(self.words)
-
-        if greyExcludeRegex:
-            result = [x for x in result if not greyExcludeRegex.search(x)]
-            log.debug('After greyExcludeRegex: {}'.format(len(result)))
-
-        if yellowExcludeRegex:
-            result = [x for x in result if not yellowExcludeRegex.search(x)]
-            log.debug('After yellowExcludeRegex: {}'.format(len(result)))
-
-        if greenIncludeRegex:
-            result = [x for x in result if greenIncludeRegex.search(x)]
-            log.debug('After greenIncludeRegex: {}'.format(len(result)))
-
-        # The word can only be considered "good" if all yellow and green 
-        # characters are present in it:
-        if allYellowAndGreenChars:
-            result = [x for x in result \
-                      if allYellowAndGreenChars.intersection(x) == allYellowAndGreenChars]
-            log.debug('After matching all yellow/green chars: {}'.format(len(result)))
+        # Bit 0 goes first, to line up with the words:
+        bits = '{:0{}b}'.format(bits, len(self.words))[::-1]
+        result = [x for x, bit in zip(self.words, bits) if bit == '1']
+        log.debug('After matching: {}'.format(len(result)))
 
         return result
 